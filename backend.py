@@ -1,99 +1,83 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from PIL import Image
 import io
-import requests
+import httpx
 import os
-import time # Import the time library
-import base64
+import asyncio
+import hashlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from types import MappingProxyType
+
+from clip_onnx import ensure_clip_image_encoder_onnx
+from kb import DISEASE_KB, ZS_LABELS
 
 # Optional local captioning (lazy loaded)
 _blip_processor = None
 _blip_model = None
-_zs_pipeline = None
-
-# Simple knowledge base for common plant diseases (leaf/fruit)
-DISEASE_KB = {
-    "powdery mildew": {
-        "why": "Caused by fungal pathogens thriving in dry, warm days and cool, humid nights; poor air circulation.",
-        "avoid": "Improve airflow, avoid overhead irrigation, prune crowded foliage, rotate crops, and use resistant varieties.",
-        "treatment": "Apply sulfur or potassium bicarbonate fungicides; remove infected leaves; maintain spacing and sanitation.",
-        "dosage": "Wettable sulfur 2–3 g/L water for foliar spray; potassium bicarbonate 5–10 g/L. Field: 1–1.5 kg/acre depending on canopy.",
-    },
-    "downy mildew": {
-        "why": "Oomycete infection favored by cool, wet conditions and prolonged leaf wetness.",
-        "avoid": "Water early so leaves dry quickly, increase spacing, rotate crops, use resistant varieties.",
-        "treatment": "Copper-based fungicides at first sign; remove infected tissue; improve drainage and airflow.",
-        "dosage": "Copper oxychloride 2–3 g/L water (200–300 g/100 L). Field: 1–2 kg/acre per spray, 7–10 day interval.",
-    },
-    "early blight": {
-        "why": "Alternaria fungus; splashes from soil, high humidity, and plant stress.",
-        "avoid": "Mulch to prevent soil splash, rotate crops 2–3 years, avoid overhead watering, fertilize adequately.",
-        "treatment": "Copper or chlorothalonil fungicides; remove infected leaves; stake plants to improve airflow.",
-        "dosage": "Chlorothalonil 2 g/L water; Mancozeb 2–2.5 g/L. Field: 1–1.5 kg/acre per application.",
-    },
-    "late blight": {
-        "why": "Phytophthora infestans; cool, humid weather; spreads rapidly via spores.",
-        "avoid": "Plant certified seed/seedlings, avoid overhead irrigation, destroy volunteers, rotate crops.",
-        "treatment": "Immediate removal and destruction of infected plants; protectant fungicides containing mancozeb/cymoxanil where permitted.",
-        "dosage": "Mancozeb 2–2.5 g/L; Cymoxanil + Mancozeb per label (commonly 1.5–2 g/L). Field: 1.5–2 kg/acre.",
-    },
-    "leaf spot": {
-        "why": "Various fungi/bacteria; splash dispersal and high humidity.",
-        "avoid": "Water at soil level, sanitize tools, remove debris, ensure spacing.",
-        "treatment": "Copper sprays for bacterial spots; broad-spectrum fungicide for fungal spots; remove infected leaves.",
-        "dosage": "Copper hydroxide 2 g/L; Captan 2 g/L for fungal spots. Field: ~1 kg/acre per spray.",
-    },
-    "rust": {
-        "why": "Fungal rusts; spread by wind-borne spores in humid conditions.",
-        "avoid": "Resistant cultivars, remove alternate hosts, avoid wet foliage.",
-        "treatment": "Apply triazole or strobilurin fungicides per label; remove infected parts.",
-        "dosage": "Propiconazole 1 ml/L water; Azoxystrobin 0.5 ml/L. Field: 200–300 ml/acre depending on formulation.",
-    },
-    "anthracnose": {
-        "why": "Colletotrichum fungi causing fruit/leaf lesions; warm, wet weather.",
-        "avoid": "Rotate crops, sanitize debris, improve airflow, avoid overhead watering.",
-        "treatment": "Protectant fungicides; prune infected tissue; postharvest sanitation for fruits.",
-        "dosage": "Carbendazim 1 g/L or Azoxystrobin 0.5 ml/L. Field: 200–300 ml or 0.5–1 kg/acre per label.",
-    },
-    "canker": {
-        "why": "Fungal/bacterial pathogens entering wounds; stress and poor pruning practices.",
-        "avoid": "Prune during dry weather, disinfect tools, avoid injuries, maintain vigor.",
-        "treatment": "Prune 10–15 cm below lesions; dispose debris; copper sprays for bacterial cankers.",
-        "dosage": "Copper oxychloride paste on wounds; spray 2–3 g/L after pruning. Field sprays as per label (~1–2 kg/acre).",
-    },
-    "mosaic virus": {
-        "why": "Viral infection often vectored by aphids/whiteflies; transmitted by tools.",
-        "avoid": "Control vectors, use virus-free seed, sanitize tools, remove weeds hosts.",
-        "treatment": "No cure; rogue infected plants; manage vectors; plant resistant varieties.",
-        "dosage": "For vectors: Neem oil 3–5 ml/L or Imidacloprid 0.3 ml/L as per local regulations.",
-    },
-    "nutrient deficiency": {
-        "why": "Insufficient or imbalanced nutrients (N, P, K, Fe, Mg) and pH issues.",
-        "avoid": "Soil test annually; maintain optimal pH; balanced fertilization; organic matter.",
-        "treatment": "Apply specific nutrient amendments per soil test; foliar feeds for rapid correction.",
-        "dosage": "General foliar feed: 1–2 g/L balanced NPK; Fe-EDDHA 0.5–1 g/L for iron chlorosis. Field: follow soil test recommendations.",
-    },
-    "sunscald": {
-        "why": "High light/heat exposure damaging fruit/leaf tissues.",
-        "avoid": "Provide shade cloth in heat waves; maintain foliage cover; avoid heavy pruning before hot days.",
-        "treatment": "Remove damaged tissue if rotting; improve shading and irrigation scheduling.",
-        "dosage": "Apply kaolin clay film 30–50 g/L as protective spray; irrigation 20–30 mm depending on soil moisture.",
-    },
-}
-
-# Candidate labels for zero-shot image classification
-ZS_LABELS = list(DISEASE_KB.keys()) + [
-    "healthy leaf",
-    "healthy fruit",
-]
+_blip_bos_ids = None
+_clip_processor = None
+_clip_model = None
+_zs_text_emb = None
+_zs_image_tower = None
+_zs_onnx_session = None
+# CLIP resize/crop/normalization constants for the GPU decode path (CUDA only)
+_clip_gpu_preprocess = None
+# Device/dtype shared by the local models (chosen on first load)
+_device = None
+_dtype = None
+# Reusable pinned host buffers (keyed by per-image shape) and side stream for CUDA input copies
+_pinned_buffers = {}
+_copy_stream = None
+
+# Response fields for healthy predictions
+_HEALTHY_INFO = MappingProxyType({
+    "name": "Healthy",
+    "why": "No disease indicators detected.",
+    "avoid": "Maintain current care; monitor regularly.",
+    "treatment": "No action needed.",
+    "healthy": True,
+})
+
+# Every zero-shot label mapped to its response fields, so a prediction resolves with one lookup
+LABEL_TO_INFO = MappingProxyType({
+    label: MappingProxyType({"name": label.title(), **DISEASE_KB[label], "healthy": False}) if label in DISEASE_KB else _HEALTHY_INFO
+    for label in ZS_LABELS
+})
+
+
+def _env_flag(name: str, default: str = "") -> bool:
+    return os.getenv(name, default).lower() in ("1", "true", "yes")
+
+
+# --- App Lifespan ---
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One pooled HTTP/2 client per worker: connections are reused and the hedged calls to
+    # all model endpoints share one multiplexed connection
+    app.state.http_client = httpx.AsyncClient(
+        http2=True,
+        timeout=60.0,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+    )
+    _preload_models()
+    _zs_batcher.start()
+    _caption_batcher.start()
+    yield
+    await _zs_batcher.stop()
+    await _caption_batcher.stop()
+    await app.state.http_client.aclose()
+
 
 # --- App Initialization ---
 app = FastAPI(
     title="PlantAI Diagnosis Backend (Hugging Face)",
     description="This API uses a Hugging Face model for a simple diagnosis with auto-retry logic.",
     version="2.2.0",
+    lifespan=lifespan,
 )
 
 # --- Environment Variable for API Key ---
@@ -106,6 +90,45 @@ API_URLS = [
     "https://api-inference.huggingface.co/models/nlpconnect/vit-gpt2-image-captioning",
 ]
 
+# --- Startup model preloading (set to 0 to fall back to lazy loading) ---
+PRELOAD_ZS = _env_flag("PRELOAD_ZS", "1")
+PRELOAD_BLIP = _env_flag("PRELOAD_BLIP", "1")
+
+# --- Quantize the local models' Linear layers to int8 on CPU (opt-in; check output quality first) ---
+INT8 = _env_flag("INT8")
+
+# --- Compile the CLIP image tower with torch.compile at load time (opt-in) ---
+TORCH_COMPILE = _env_flag("TORCH_COMPILE")
+
+# --- Serve the CLIP image tower from this ONNX file via ONNX Runtime (exported on first start) ---
+CLIP_ONNX_PATH = os.getenv("CLIP_ONNX_PATH", "")
+
+# --- Decode JPEG uploads with nvJPEG when the models run on CUDA ---
+GPU_DECODE = _env_flag("GPU_DECODE", "1")
+
+# --- Micro-batching window for local inference ---
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "8"))
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "15"))
+
+# --- Shorter side uploads are downscaled to on decode (BLIP takes 384x384, CLIP 224x224) ---
+DECODE_MIN_SIDE = int(os.getenv("DECODE_MIN_SIDE", "384"))
+
+# --- Recent /predict results keyed by image content hash (0 disables) ---
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "512"))
+
+# --- Largest accepted upload; bigger requests are rejected before the body is read ---
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", 10 * 1024 * 1024))
+
+# --- Upload size limit ---
+# Runs before FastAPI parses the multipart body, which a route dependency would not.
+# Registered before CORS so 413 responses still carry CORS headers.
+@app.middleware("http")
+async def enforce_upload_size(request: Request, call_next):
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > MAX_UPLOAD_BYTES:
+        return JSONResponse(status_code=413, content={"detail": "Image too large."})
+    return await call_next(request)
+
 # --- CORS Configuration ---
 origins = [
     "http://localhost",
@@ -121,9 +144,10 @@ app.add_middleware(
 )
 
 # --- Hugging Face Diagnosis Call with Auto-Retry ---
-async def get_simple_diagnosis(image_bytes: bytes):
+async def get_simple_diagnosis(image_bytes: bytes, client: httpx.AsyncClient, image=None):
     """
     Calls a Hugging Face model with a retry mechanism to handle model loading.
+    Uses the shared async client so the event loop is never blocked on network I/O.
     """
     print("Backend received a request. Preparing to call Hugging Face API...")
     if not API_KEY:
@@ -137,54 +161,40 @@ async def get_simple_diagnosis(image_bytes: bytes):
     }
     
     # Short-circuit to local captioning if requested
-    if os.getenv("USE_LOCAL_ONLY", "").lower() in ("1", "true", "yes"): 
+    if _env_flag("USE_LOCAL_ONLY"):
         print("USE_LOCAL_ONLY is set. Skipping remote inference and using local BLIP.")
-        local_caption = local_image_caption(image_bytes)
+        local_caption = await _local_caption(image if image is not None else image_bytes)
         return _format_response_from_caption(local_caption, confidence=0.70)
 
-    # --- Try multiple models with retry on 503/loading ---
-    max_retries = 3
+    # --- Hedge: query all models at once; the first caption wins and the rest are cancelled ---
     last_error_message = None
-    for api_url in API_URLS:
-        print(f"Trying model endpoint: {api_url}")
-        for attempt in range(max_retries):
-            try:
-                response = requests.post(api_url, headers=headers, data=image_bytes, timeout=60)
-
-                if response.status_code == 200:
-                    print("Successfully received a response from Hugging Face.")
-                    result = response.json()
-                    # Response can be a list of dicts with 'generated_text'
-                    if isinstance(result, list) and result and isinstance(result[0], dict):
-                        caption = result[0].get('generated_text') or result[0].get('caption') or 'Could not analyze image.'
-                    elif isinstance(result, dict):
-                        caption = result.get('generated_text') or result.get('caption') or 'Could not analyze image.'
-                    else:
-                        caption = 'Could not analyze image.'
-
-                    return _format_response_from_caption(caption, confidence=0.90)
-
-                if response.status_code == 503:
-                    print(f"Attempt {attempt + 1}/{max_retries}: Model is loading, waiting 20 seconds before retrying...")
-                    time.sleep(20)
+    tasks = [
+        asyncio.create_task(_caption_from_endpoint(client, api_url, headers, image_bytes))
+        for api_url in API_URLS
+    ]
+    try:
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                try:
+                    caption = task.result()
+                except (httpx.HTTPError, _EndpointError, ValueError) as e:
+                    last_error_message = str(e)
+                    print(f"A Hugging Face model endpoint failed: {e}")
                     continue
-
-                # Non-200/503 → capture and try next endpoint
-                last_error_message = f"{response.status_code} {response.text[:200]}" if response is not None else "Unknown error"
-                print(f"Received an unexpected status code: {response.status_code} - trying next model if available")
-                break
-
-            except requests.exceptions.RequestException as e:
-                last_error_message = str(e)
-                print(f"An error occurred while communicating with Hugging Face: {e}")
-                break
+                print("Successfully received a response from Hugging Face.")
+                return _format_response_from_caption(caption, confidence=0.90)
+    finally:
+        for task in tasks:
+            task.cancel()
 
     # Fallback: return graceful response instead of 500 so the UI can proceed
     print("All model endpoints failed. Returning fallback analysis.")
     # Attempt local captioning before returning fallback
     try:
         print("Trying local BLIP captioning as a fallback...")
-        local_caption = local_image_caption(image_bytes)
+        local_caption = await _local_caption(image if image is not None else image_bytes)
         return _format_response_from_caption(local_caption, confidence=0.70)
     except Exception as e:
         print(f"Local captioning failed: {e}")
@@ -204,6 +214,37 @@ async def get_simple_diagnosis(image_bytes: bytes):
     }
 
 
+class _EndpointError(Exception):
+    """A model endpoint answered, but not with a caption."""
+
+
+async def _caption_from_endpoint(client: httpx.AsyncClient, api_url: str, headers: dict, image_bytes: bytes, max_retries: int = 3) -> str:
+    """
+    Queries one Inference API model, retrying while it reports that it is still loading (503).
+    """
+    print(f"Trying model endpoint: {api_url}")
+    for attempt in range(max_retries):
+        response = await client.post(api_url, headers=headers, content=image_bytes)
+
+        if response.status_code == 200:
+            result = response.json()
+            # Response can be a list of dicts with 'generated_text'
+            if isinstance(result, list) and result and isinstance(result[0], dict):
+                return result[0].get('generated_text') or result[0].get('caption') or 'Could not analyze image.'
+            if isinstance(result, dict):
+                return result.get('generated_text') or result.get('caption') or 'Could not analyze image.'
+            return 'Could not analyze image.'
+
+        if response.status_code == 503:
+            print(f"{api_url} attempt {attempt + 1}/{max_retries}: Model is loading, waiting 20 seconds before retrying...")
+            await asyncio.sleep(20)
+            continue
+
+        raise _EndpointError(f"{response.status_code} {response.text[:200]}")
+
+    raise _EndpointError(f"{api_url} was still loading after {max_retries} attempts")
+
+
 def _format_response_from_caption(caption: str, confidence: float = 0.90):
     return {
         "disease_name": "AI Analysis",
@@ -213,99 +254,517 @@ def _format_response_from_caption(caption: str, confidence: float = 0.90):
     }
 
 
+def _preload_models():
+    """
+    Loads the local models at startup so the first /predict does not pay for from_pretrained.
+    Failures are logged only; the lazy loaders retry on the request path.
+    """
+    try:
+        import torch
+    except ImportError as e:
+        print(f"torch is not available, skipping model preloading: {e}")
+        return
+
+    for enabled, name, loader in (
+        (PRELOAD_ZS, "zero-shot classifier", _ensure_zero_shot_loaded),
+        (PRELOAD_BLIP, "BLIP captioning model", _ensure_local_blip_loaded),
+    ):
+        if not enabled:
+            continue
+        print(f"Preloading {name}...")
+        try:
+            loader()
+        except HTTPException as e:
+            print(f"Preloading {name} failed: {e.detail}")
+
+
+def _ensure_device_selected():
+    """
+    Picks CUDA with fp16 when available; on CPU uses bf16 if the CPU supports it, else fp32
+    (always fp32 when INT8 is set, since those weights get quantized).
+    """
+    global _device, _dtype
+    if _device is not None:
+        return
+    import torch
+    if torch.cuda.is_available():
+        _device, _dtype = "cuda", torch.float16
+    elif INT8:
+        # Dynamic int8 quantization expects fp32 weights to start from
+        _device, _dtype = "cpu", torch.float32
+    elif torch.cpu.is_bf16_supported():
+        _device, _dtype = "cpu", torch.bfloat16
+    else:
+        _device, _dtype = "cpu", torch.float32
+    app.state.device = _device
+    print(f"Local models will run on {_device} ({_dtype}).")
+
+
+def _maybe_quantize(model):
+    """
+    With INT8 set on CPU, swaps the model's Linear layers for dynamically quantized int8 ones.
+    """
+    if not INT8 or _device != "cpu":
+        return model
+    import torch
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def _to_device_batch(tensors: list):
+    """
+    Concatenates per-request input tensors into one batch on the model device. On CUDA, CPU
+    inputs are staged in a reusable pinned buffer and copied on a side stream, so the transfer
+    can overlap with work already queued on the compute stream.
+    """
+    global _copy_stream
+    import torch
+    if _device != "cuda" or any(t.is_cuda for t in tensors):
+        return torch.cat([t.to(_device) for t in tensors]).to(dtype=_dtype)
+
+    batch_size = sum(t.shape[0] for t in tensors)
+    item_shape = tuple(tensors[0].shape[1:])
+    buffer = _pinned_buffers.get(item_shape)
+    if buffer is None or buffer.shape[0] < batch_size:
+        buffer = torch.empty((max(batch_size, BATCH_MAX_SIZE), *item_shape), dtype=tensors[0].dtype, pin_memory=True)
+        _pinned_buffers[item_shape] = buffer
+    # Safe to overwrite: the previous batch's outputs were read back to the host, which waited on its copy
+    staged = torch.cat(tensors, out=buffer[:batch_size])
+
+    if _copy_stream is None:
+        _copy_stream = torch.cuda.Stream()
+    with torch.cuda.stream(_copy_stream):
+        batch = staged.to("cuda", non_blocking=True).to(dtype=_dtype)
+    compute_stream = torch.cuda.current_stream()
+    compute_stream.wait_stream(_copy_stream)
+    batch.record_stream(compute_stream)
+    return batch
+
+
 def _ensure_local_blip_loaded():
-    global _blip_processor, _blip_model
-    if _blip_processor is not None and _blip_model is not None:
+    global _blip_processor, _blip_model, _blip_bos_ids
+    if _blip_processor is not None and _blip_model is not None and _blip_bos_ids is not None:
         return
     try:
         from transformers import BlipProcessor, BlipForConditionalGeneration
+        _ensure_device_selected()
         _blip_processor = BlipProcessor.from_pretrained("Salesforce/blip-image-captioning-base")
-        _blip_model = BlipForConditionalGeneration.from_pretrained("Salesforce/blip-image-captioning-base")
+        _blip_model = _maybe_quantize(
+            BlipForConditionalGeneration.from_pretrained("Salesforce/blip-image-captioning-base")
+            .to(device=_device, dtype=_dtype)
+            .eval()
+        )
+        # generate() would otherwise rebuild this BOS prompt for every call
+        _blip_bos_ids = _blip_processor.tokenizer("", return_tensors="pt").input_ids.to(_device)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Local captioning model could not be loaded: {e}")
 
 
-def local_image_caption(image_bytes: bytes) -> str:
+def _decode_image(source):
+    """
+    Decodes an upload (bytes or a binary file object) once into RGB, downscaled so its shorter
+    side is DECODE_MIN_SIDE. For JPEGs, draft() lets libjpeg shrink the image while decoding.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    image = Image.open(source)
+    image.draft("RGB", (DECODE_MIN_SIDE, DECODE_MIN_SIDE))
+    image = image.convert("RGB")
+    scale = DECODE_MIN_SIDE / min(image.size)
+    if scale < 1:
+        image = image.resize((round(image.width * scale), round(image.height * scale)), Image.BILINEAR)
+    return image
+
+
+def _as_rgb_image(image):
+    # Accept raw upload bytes or an image already decoded by _decode_image
+    return image if isinstance(image, Image.Image) else _decode_image(image)
+
+
+def _blip_pixel_values(image):
+    """Preprocesses an image (bytes or decoded) for BLIP; only this tensor goes through the batch queue."""
+    _ensure_local_blip_loaded()
+    try:
+        return _blip_processor.image_processor(_as_rgb_image(image), return_tensors="pt")["pixel_values"]
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Local captioning failed: {e}")
+
+
+def _caption_batch(pixel_values_list: list) -> list:
     _ensure_local_blip_loaded()
     try:
-        from PIL import Image as PILImage
         import torch
-        image = PILImage.open(io.BytesIO(image_bytes)).convert("RGB")
-        inputs = _blip_processor(image, return_tensors="pt")
-        with torch.no_grad():
-            out = _blip_model.generate(**inputs, max_new_tokens=30)
-        caption = _blip_processor.decode(out[0], skip_special_tokens=True)
-        return caption
+        pixel_values = _to_device_batch(pixel_values_list)
+        with torch.inference_mode():
+            # Greedy decoding from the cached BOS prompt; no beam search branching
+            out = _blip_model.generate(
+                pixel_values=pixel_values,
+                # generate() writes the BOS column in place, so pass a copy rather than a view of the cache
+                input_ids=_blip_bos_ids.repeat(pixel_values.shape[0], 1),
+                max_new_tokens=30,
+                num_beams=1,
+                do_sample=False,
+            )
+        return _blip_processor.batch_decode(out, skip_special_tokens=True)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Local captioning failed: {e}")
 
 
+def local_image_caption(image) -> str:
+    return _caption_batch([_blip_pixel_values(image)])[0]
+
+
+def _load_onnx_vision_session():
+    """
+    Returns an ONNX Runtime session for the CLIP image embedder when CLIP_ONNX_PATH is set,
+    exporting the model first if the file for this precision doesn't exist yet. Returns None to
+    stay on PyTorch.
+    """
+    if not CLIP_ONNX_PATH:
+        return None
+    try:
+        import onnxruntime as ort
+        # The int8 weights only pay off on CPU, matching _maybe_quantize
+        path = ensure_clip_image_encoder_onnx(CLIP_ONNX_PATH, int8=INT8 and _device == "cpu")
+        available = ort.get_available_providers()
+        providers = [p for p in ("CUDAExecutionProvider", "CPUExecutionProvider") if p in available]
+        return ort.InferenceSession(path, providers=providers)
+    except Exception as e:
+        print(f"ONNX Runtime CLIP vision tower unavailable, using PyTorch: {e}")
+        return None
+
+
+def _compile_image_tower(model):
+    """
+    Returns CLIP's vision tower compiled with torch.compile, warmed up at every micro-batch size so
+    no request pays for compilation or CUDA graph capture. The batch dim is dynamic, so this only
+    compiles twice (size 1 is specialized). Falls back to the eager module if compilation fails.
+    """
+    import torch
+    if not TORCH_COMPILE:
+        return model.vision_model
+    try:
+        tower = torch.compile(model.vision_model, mode="reduce-overhead", fullgraph=True, dynamic=True)
+        size = model.config.vision_config.image_size
+        with torch.inference_mode():
+            for batch_size in range(1, BATCH_MAX_SIZE + 1):
+                tower(pixel_values=torch.zeros((batch_size, 3, size, size), device=_device, dtype=_dtype))
+        return tower
+    except Exception as e:
+        print(f"torch.compile of the CLIP image tower failed, using eager mode: {e}")
+        return model.vision_model
+
+
 def _ensure_zero_shot_loaded():
-    global _zs_pipeline
-    if _zs_pipeline is not None:
+    global _clip_processor, _clip_model, _zs_text_emb, _zs_image_tower, _zs_onnx_session, _clip_gpu_preprocess
+    if _zs_text_emb is not None:
         return
     try:
-        from transformers import pipeline
-        _zs_pipeline = pipeline("zero-shot-image-classification", model="openai/clip-vit-base-patch32")
+        import torch
+        import torch.nn.functional as F
+        from transformers import CLIPModel, CLIPProcessor
+        _ensure_device_selected()
+        processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32")
+        model = _maybe_quantize(
+            CLIPModel.from_pretrained("openai/clip-vit-base-patch32").to(device=_device, dtype=_dtype).eval()
+        )
+        # The label prompts never change, so encode them once instead of on every request
+        text_inputs = processor(text=[f"a photo of {label}" for label in ZS_LABELS], return_tensors="pt", padding=True)
+        text_inputs = {k: v.to(_device) for k, v in text_inputs.items()}
+        with torch.inference_mode():
+            # Kept in fp32: scores are computed in full precision whatever the model dtype
+            text_emb = F.normalize(model.get_text_features(**text_inputs).float(), dim=-1)
+        _zs_onnx_session = _load_onnx_vision_session()
+        # The PyTorch tower is only compiled when ONNX Runtime isn't serving it
+        _zs_image_tower = model.vision_model if _zs_onnx_session is not None else _compile_image_tower(model)
+        if _device == "cuda":
+            image_processor = processor.image_processor
+            _clip_gpu_preprocess = (
+                image_processor.size["shortest_edge"],
+                image_processor.crop_size["height"],
+                torch.tensor(image_processor.image_mean, device=_device).view(1, 3, 1, 1),
+                torch.tensor(image_processor.image_std, device=_device).view(1, 3, 1, 1),
+            )
+        _clip_processor, _clip_model, _zs_text_emb = processor, model, text_emb
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Zero-shot classifier could not be loaded: {e}")
 
 
-def local_zero_shot_diagnose(image_bytes: bytes):
+def _gpu_clip_pixel_values(fileobj):
+    """
+    Decodes a JPEG upload with nvJPEG and applies CLIP's resize, center crop and normalization on
+    the GPU, skipping PIL and the CLIPProcessor. Returns None when this path doesn't apply
+    (no CUDA, torchvision missing, non-JPEG or corrupt data) so the caller can use PIL instead.
+    """
+    if not GPU_DECODE:
+        return None
+    # Load failures propagate to the caller; only decode problems fall back to PIL below
     _ensure_zero_shot_loaded()
+    if _clip_gpu_preprocess is None:
+        return None
     try:
-        image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-        results = _zs_pipeline(image, candidate_labels=ZS_LABELS, hypothesis_template="a photo of {}")
-        # results is list of dicts sorted by score
-        top = results[0]
-        label = top.get("label", "unknown").lower()
-        score = float(top.get("score", 0.0))
-        kb_key = label
-        if kb_key not in DISEASE_KB:
-            # map healthy
-            if "healthy" in kb_key:
-                return _format_knowledge_response(
-                    name="Healthy",
-                    confidence=score,
-                    why="No disease indicators detected.",
-                    avoid="Maintain current care; monitor regularly.",
-                    treatment="No action needed.",
-                )
-            # fallback generic
-            return _format_response_from_caption(f"Possible condition: {label}", confidence=score)
-
-        info = DISEASE_KB[kb_key]
-        return _format_knowledge_response(
-            name=kb_key.title(),
-            confidence=score,
-            why=info["why"],
-            avoid=info["avoid"],
-            treatment=info["treatment"],
+        import torch
+        import torch.nn.functional as F
+        from torchvision.io import ImageReadMode, decode_jpeg
+        # Read the spooled upload straight into one preallocated buffer
+        size = fileobj.seek(0, os.SEEK_END)
+        fileobj.seek(0)
+        buffer = bytearray(size)
+        fileobj.readinto(buffer)
+        data = torch.frombuffer(buffer, dtype=torch.uint8)
+        image = decode_jpeg(data, mode=ImageReadMode.RGB, device="cuda").unsqueeze(0).float()
+        shortest_edge, crop, mean, std = _clip_gpu_preprocess
+        height, width = image.shape[-2:]
+        scale = shortest_edge / min(height, width)
+        image = F.interpolate(
+            image, size=(round(height * scale), round(width * scale)), mode="bicubic", antialias=True
         )
+        top = (image.shape[-2] - crop) // 2
+        left = (image.shape[-1] - crop) // 2
+        image = image[..., top:top + crop, left:left + crop]
+        return (image / 255 - mean) / std
+    except Exception as e:
+        print(f"GPU JPEG decode unavailable, using PIL: {e}")
+        return None
+
+
+def _clip_pixel_values(image):
+    """Preprocesses an image (bytes or decoded) for CLIP; only this tensor goes through the batch queue."""
+    _ensure_zero_shot_loaded()
+    try:
+        return _clip_processor(images=_as_rgb_image(image), return_tensors="pt")["pixel_values"]
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Local diagnosis failed: {e}")
+
+
+def _zs_image_embeddings(pixel_values_list: list):
+    import torch
+    if _zs_onnx_session is not None:
+        pixel_values = torch.cat([t.float().cpu() for t in pixel_values_list]).numpy()
+        image_embeds = _zs_onnx_session.run(None, {"pixel_values": pixel_values})[0]
+        return torch.from_numpy(image_embeds).to(_device)
+    pixel_values = _to_device_batch(pixel_values_list)
+    return _clip_model.visual_projection(_zs_image_tower(pixel_values=pixel_values).pooler_output)
+
+
+def _zero_shot_batch(pixel_values_list: list) -> list:
+    _ensure_zero_shot_loaded()
+    try:
+        import torch
+        import torch.nn.functional as F
+        with torch.inference_mode():
+            # Only the image tower runs per request; labels are scored against the cached text embeddings
+            # Upcast before normalizing: fp16/bf16 logits at CLIP's scale quantize the confidences
+            img_emb = F.normalize(_zs_image_embeddings(pixel_values_list).float(), dim=-1)
+            logits = _clip_model.logit_scale.float().exp() * img_emb @ _zs_text_emb.T
+            probs = logits.softmax(dim=-1)
+        scores, indices = probs.max(dim=-1)
+        return [
+            _format_knowledge_response(LABEL_TO_INFO[ZS_LABELS[index]], score)
+            for score, index in zip(scores.tolist(), indices.tolist())
+        ]
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Local diagnosis failed: {e}")
 
 
+def local_zero_shot_diagnose(image):
+    return _zero_shot_batch([_clip_pixel_values(image)])[0]
+
+
+# --- Micro-batching for local inference ---
+# Model calls run on one dedicated thread so the event loop keeps serving requests,
+# and GPU/CPU access by the models stays serialized.
+_INFER_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
+
+
+async def _run_on_inference_thread(func, *args):
+    # Preprocessing and lazy model loads block, so they run on the inference thread too;
+    # that also keeps a lazy load from racing another one
+    return await asyncio.get_running_loop().run_in_executor(_INFER_EXECUTOR, func, *args)
+
+
+class _MicroBatcher:
+    """
+    Groups items submitted within BATCH_MAX_WAIT_MS (up to BATCH_MAX_SIZE) into one model call.
+    `run_batch` receives a list of items and must return one result per item, in order.
+    """
+
+    def __init__(self, name: str, run_batch):
+        self.name = name
+        self.run_batch = run_batch
+        self._queue = None
+        self._task = None
+        # Futures of the batch currently being collected or run, so stop() can fail them
+        self._inflight = []
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._worker())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        # Fail everything still waiting so callers don't hang until the server is killed
+        pending = [future for _, future in self._inflight]
+        while not self._queue.empty():
+            pending.append(self._queue.get_nowait()[1])
+        self._inflight = []
+        for future in pending:
+            if not future.done():
+                future.set_exception(RuntimeError(f"{self.name} batcher is shutting down"))
+
+    async def submit(self, item):
+        # Outside the app lifespan (e.g. scripts) there is no worker; run the item on its own
+        if self._task is None:
+            results = await asyncio.get_running_loop().run_in_executor(_INFER_EXECUTOR, self.run_batch, [item])
+            return results[0]
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = self._inflight = [await self._queue.get()]
+            deadline = loop.time() + BATCH_MAX_WAIT_MS / 1000
+            while len(batch) < BATCH_MAX_SIZE:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                results = await loop.run_in_executor(_INFER_EXECUTOR, self.run_batch, [item for item, _ in batch])
+            except Exception as e:
+                print(f"{self.name} batch of {len(batch)} failed: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future), result in zip(batch, results):
+                # The request may have been cancelled while waiting
+                if not future.done():
+                    future.set_result(result)
+
+
+_zs_batcher = _MicroBatcher("Zero-shot", _zero_shot_batch)
+_caption_batcher = _MicroBatcher("Captioning", _caption_batch)
+
+
+async def _local_caption(image) -> str:
+    pixel_values = await _run_on_inference_thread(_blip_pixel_values, image)
+    return await _caption_batcher.submit(pixel_values)
+
+
+# --- Result cache ---
+# Only touched from the event loop between awaits, so no lock is needed.
+_result_cache = OrderedDict()
+
+
+def _cache_get(digest: bytes):
+    result = _result_cache.get(digest)
+    if result is not None:
+        _result_cache.move_to_end(digest)
+    return result
+
+
+def _cache_put(digest: bytes, result: dict):
+    if digest is None or RESULT_CACHE_SIZE <= 0:
+        return
+    _result_cache[digest] = result
+    _result_cache.move_to_end(digest)
+    while len(_result_cache) > RESULT_CACHE_SIZE:
+        _result_cache.popitem(last=False)
+
+
+def _hash_upload(fileobj) -> bytes:
+    # Hash in chunks so the upload never has to exist as one contiguous bytes object
+    hasher = hashlib.blake2b(digest_size=16)
+    fileobj.seek(0)
+    for chunk in iter(lambda: fileobj.read(1024 * 1024), b""):
+        hasher.update(chunk)
+    return hasher.digest()
+
+
+def _read_upload(fileobj) -> bytes:
+    fileobj.seek(0)
+    return fileobj.read()
+
+
+def _open_upload(fileobj):
+    # verify() checks the file structure without decoding pixels; it leaves the image unusable
+    fileobj.seek(0)
+    Image.open(fileobj).verify()
+    fileobj.seek(0)
+    return _decode_image(fileobj)
+
+
 # --- API Endpoint ---
 @app.post("/predict")
-async def predict(file: UploadFile = File(...)):
+async def predict(request: Request, file: UploadFile = File(...)):
     if not file.content_type or not file.content_type.startswith('image/'):
         raise HTTPException(status_code=400, detail="File provided is not a valid image.")
 
-    try:
-        image_bytes = await file.read()
-        Image.open(io.BytesIO(image_bytes))
-    except Exception:
-        raise HTTPException(status_code=400, detail="Invalid or corrupted image file.")
-    
+    # Chunked uploads carry no Content-Length, so check the received size as well
+    if file.size is not None and file.size > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail="Image too large.")
+
+    # Work from the spooled upload file directly instead of copying it into memory
+    upload = file.file
+
+    # Hashing, decoding and reading the spooled file are blocking, so none of it runs on the loop
+    loop = asyncio.get_running_loop()
+
+    # Identical uploads (refreshes, demo images) skip inference entirely
+    digest = None
+    if RESULT_CACHE_SIZE > 0:
+        digest = await loop.run_in_executor(None, _hash_upload, upload)
+        cached = _cache_get(digest)
+        if cached is not None:
+            return JSONResponse(content=cached)
+
+    # On CUDA, JPEGs are decoded and preprocessed on the GPU; a successful decode validates them
+    image = None
+    pixel_values = None
+    # Checked here so CPU hosts don't queue behind a running batch just to get None back
+    if GPU_DECODE and _device == "cuda" and file.content_type in ("image/jpeg", "image/jpg"):
+        try:
+            pixel_values = await _run_on_inference_thread(_gpu_clip_pixel_values, upload)
+        except Exception as e:
+            print(f"Zero-shot classifier unavailable for GPU decode: {e}")
+
+    # Otherwise decode once with PIL; both local models reuse this image
+    if pixel_values is None:
+        try:
+            # Plain PIL decode touches no model state, so the default pool is enough
+            image = await loop.run_in_executor(None, _open_upload, upload)
+        except Exception:
+            raise HTTPException(status_code=400, detail="Invalid or corrupted image file.")
+
     # Try local zero-shot diagnosis first for actionable disease output
     try:
-        zs_result = local_zero_shot_diagnose(image_bytes)
+        if pixel_values is None:
+            pixel_values = await _run_on_inference_thread(_clip_pixel_values, image)
+        zs_result = await _zs_batcher.submit(pixel_values)
+        _cache_put(digest, zs_result)
         return JSONResponse(content=zs_result)
     except Exception as e:
         print(f"Zero-shot diagnosis failed, falling back to captioning: {e}")
 
-    diagnosis_result = await get_simple_diagnosis(image_bytes)
+    # The remote captioning models need the raw bytes, so only read them on this path
+    image_bytes = await loop.run_in_executor(None, _read_upload, upload)
+    diagnosis_result = await get_simple_diagnosis(image_bytes, request.app.state.http_client, image)
+    # Not cached: zero-shot may have failed transiently (OOM, failed batch), and a cached caption
+    # answer would keep hiding the disease diagnosis for this image
     return JSONResponse(content=diagnosis_result)
 
 @app.get("/")
@@ -313,19 +772,15 @@ def read_root():
     return {"message": "Welcome to the PlantAI Backend (Hugging Face Version with Auto-Retry)."}
 
 
-def _format_knowledge_response(name: str, confidence: float, why: str, avoid: str, treatment: str):
-    # If the disease exists in KB and has dosage, append it to treatment
-    dosage = None
-    kb_key = name.lower()
-    if kb_key in DISEASE_KB:
-        dosage = DISEASE_KB[kb_key].get("dosage")
-    treatment_text = treatment
-    if dosage:
-        treatment_text = f"{treatment}\n\nRecommended dosage: {dosage}"
+def _format_knowledge_response(info, confidence: float):
+    # If the label has a dosage, append it to treatment
+    treatment_text = info["treatment"]
+    if info.get("dosage"):
+        treatment_text = f"{treatment_text}\n\nRecommended dosage: {info['dosage']}"
     return {
-        "disease_name": name,
+        "disease_name": info["name"],
         "confidence": confidence,
-        "description": f"Why it occurs: {why}\n\nHow to avoid: {avoid}",
+        "description": f"Why it occurs: {info['why']}\n\nHow to avoid: {info['avoid']}",
         "treatment": treatment_text,
     }
 
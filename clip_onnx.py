@@ -0,0 +1,61 @@
+import os
+
+# Shared by the frontend and backend. Both read a base path from CLIP_ONNX_PATH; the int8 variant
+# lives next to it as <root>.int8.onnx so the two processes never load each other's artifact
+
+
+def ensure_clip_image_encoder_onnx(path: str, int8: bool = False) -> str:
+    """
+    Returns the path of the CLIP image encoder ONNX file for the requested precision (`path` for
+    fp32, `<root>.int8.onnx` for int8), exporting it first if it doesn't exist yet.
+    """
+    target = os.path.splitext(path)[0] + ".int8.onnx" if int8 else path
+    if not os.path.exists(target):
+        export_clip_image_encoder_onnx(target, int8=int8)
+    return target
+
+
+def export_clip_image_encoder_onnx(path: str, int8: bool = False):
+    """
+    One-time export of CLIP's vision tower plus projection (pixel_values -> image_embeds) to ONNX,
+    optionally followed by dynamic int8 weight quantization. Exports from a fresh fp32 copy so it
+    works regardless of the serving dtype or quantization. The file is written under a per-process
+    temporary name and moved into place with os.replace, so concurrent exporters never expose a
+    partially written model.
+    """
+    import torch
+    from transformers import CLIPModel
+
+    class _ImageEmbedder(torch.nn.Module):
+        def __init__(self, clip):
+            super().__init__()
+            self.vision_model = clip.vision_model
+            self.visual_projection = clip.visual_projection
+
+        def forward(self, pixel_values):
+            return self.visual_projection(self.vision_model(pixel_values=pixel_values).pooler_output)
+
+    model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32").eval()
+    size = model.config.vision_config.image_size
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    export_path = f"{path}.{os.getpid()}.fp32.tmp" if int8 else tmp_path
+    print(f"Exporting CLIP vision tower to {path}...")
+    try:
+        with torch.no_grad():
+            torch.onnx.export(
+                _ImageEmbedder(model),
+                (torch.zeros((1, 3, size, size)),),
+                export_path,
+                input_names=["pixel_values"],
+                output_names=["image_embeds"],
+                dynamic_axes={"pixel_values": {0: "batch"}, "image_embeds": {0: "batch"}},
+                opset_version=17,
+            )
+        if int8:
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            quantize_dynamic(export_path, tmp_path, weight_type=QuantType.QInt8)
+        os.replace(tmp_path, path)
+    finally:
+        for leftover in {export_path, tmp_path}:
+            if os.path.exists(leftover):
+                os.remove(leftover)
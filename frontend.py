@@ -3,121 +3,198 @@ import requests
 from PIL import Image
 import io
 import os
-from typing import Dict, Any
-
-# --- Local AI (zero-shot) globals ---
-_zs_pipeline = None
-
-# --- Knowledge base (same as backend) ---
-DISEASE_KB = {
-    "powdery mildew": {
-        "why": "Caused by fungal pathogens thriving in dry, warm days and cool, humid nights; poor air circulation.",
-        "avoid": "Improve airflow, avoid overhead irrigation, prune crowded foliage, rotate crops, and use resistant varieties.",
-        "treatment": "Apply sulfur or potassium bicarbonate fungicides; remove infected leaves; maintain spacing and sanitation.",
-        "dosage": "Wettable sulfur 2–3 g/L water; potassium bicarbonate 5–10 g/L. Field: 1–1.5 kg/acre.",
-    },
-    "downy mildew": {
-        "why": "Oomycete infection favored by cool, wet conditions and prolonged leaf wetness.",
-        "avoid": "Water early so leaves dry quickly, increase spacing, rotate crops, use resistant varieties.",
-        "treatment": "Copper-based fungicides at first sign; remove infected tissue; improve drainage and airflow.",
-        "dosage": "Copper oxychloride 2–3 g/L (200–300 g/100 L). Field: 1–2 kg/acre.",
-    },
-    "early blight": {
-        "why": "Alternaria fungus; splashes from soil, high humidity, and plant stress.",
-        "avoid": "Mulch to prevent soil splash, rotate crops 2–3 years, avoid overhead watering, fertilize adequately.",
-        "treatment": "Copper or chlorothalonil fungicides; remove infected leaves; stake plants to improve airflow.",
-        "dosage": "Chlorothalonil 2 g/L; Mancozeb 2–2.5 g/L. Field: 1–1.5 kg/acre.",
-    },
-    "late blight": {
-        "why": "Phytophthora infestans; cool, humid weather; spreads rapidly via spores.",
-        "avoid": "Plant certified seed/seedlings, avoid overhead irrigation, destroy volunteers, rotate crops.",
-        "treatment": "Immediate removal of infected plants; protectant fungicides with mancozeb/cymoxanil where permitted.",
-        "dosage": "Mancozeb 2–2.5 g/L; Cymoxanil + Mancozeb 1.5–2 g/L. Field: 1.5–2 kg/acre.",
-    },
-    "leaf spot": {
-        "why": "Various fungi/bacteria; splash dispersal and high humidity.",
-        "avoid": "Water at soil level, sanitize tools, remove debris, ensure spacing.",
-        "treatment": "Copper for bacterial spots; broad-spectrum fungicide for fungal spots.",
-        "dosage": "Copper hydroxide 2 g/L; Captan 2 g/L. Field: ~1 kg/acre.",
-    },
-    "rust": {
-        "why": "Fungal rusts; spread by wind-borne spores in humid conditions.",
-        "avoid": "Resistant cultivars, remove alternate hosts, avoid wet foliage.",
-        "treatment": "Apply triazole or strobilurin fungicides per label.",
-        "dosage": "Propiconazole 1 ml/L; Azoxystrobin 0.5 ml/L. Field: 200–300 ml/acre.",
-    },
-    "anthracnose": {
-        "why": "Colletotrichum fungi causing fruit/leaf lesions; warm, wet weather.",
-        "avoid": "Rotate crops, sanitize debris, improve airflow, avoid overhead watering.",
-        "treatment": "Protectant fungicides; prune infected tissue; postharvest sanitation for fruits.",
-        "dosage": "Carbendazim 1 g/L or Azoxystrobin 0.5 ml/L. Field: 200–300 ml or 0.5–1 kg/acre.",
-    },
-    "canker": {
-        "why": "Fungal/bacterial pathogens entering wounds; stress and poor pruning practices.",
-        "avoid": "Prune during dry weather, disinfect tools, avoid injuries, maintain vigor.",
-        "treatment": "Prune 10–15 cm below lesions; dispose debris; copper sprays for bacterial cankers.",
-        "dosage": "Copper oxychloride paste on wounds; spray 2–3 g/L after pruning. Field: ~1–2 kg/acre.",
-    },
-    "mosaic virus": {
-        "why": "Viral infection often vectored by aphids/whiteflies; transmitted by tools.",
-        "avoid": "Control vectors, use virus-free seed, sanitize tools, remove weed hosts.",
-        "treatment": "No cure; rogue infected plants; manage vectors; plant resistant varieties.",
-        "dosage": "For vectors: Neem oil 3–5 ml/L or Imidacloprid 0.3 ml/L (where permitted).",
-    },
-    "nutrient deficiency": {
-        "why": "Insufficient or imbalanced nutrients and pH issues.",
-        "avoid": "Soil test annually; maintain optimal pH; balanced fertilization; organic matter.",
-        "treatment": "Apply specific nutrient amendments per soil test; foliar feeds for rapid correction.",
-        "dosage": "Foliar NPK 1–2 g/L; Fe-EDDHA 0.5–1 g/L for iron chlorosis.",
-    },
-    "sunscald": {
-        "why": "High light/heat exposure damaging fruit/leaf tissues.",
-        "avoid": "Provide shade cloth in heat waves; maintain foliage cover; avoid heavy pruning before hot days.",
-        "treatment": "Remove damaged tissue if rotting; improve shading and irrigation scheduling.",
-        "dosage": "Kaolin clay film 30–50 g/L; irrigation 20–30 mm depending on soil moisture.",
-    },
+import hashlib
+import gc
+from typing import Dict, Any, List
+from clip_onnx import ensure_clip_image_encoder_onnx
+from kb import DISEASE_KB, ZS_LABELS
+# torch, transformers and onnxruntime are imported lazily inside the local-inference
+# helpers below, so sessions that only call the backend never load them
+
+def _env_flag(name: str, default: str = "") -> bool:
+    return os.getenv(name, default).lower() in ("1", "true", "yes")
+
+# --- Knowledge base (shared with the backend in kb.py) ---
+
+# The KB is static, so the response text for each label is assembled once at import
+_KB_RESPONSES = {
+    label: {
+        "disease_name": label.title(),
+        "description": f"Why it occurs: {kb['why']}\n\nHow to avoid: {kb['avoid']}",
+        "treatment": kb["treatment"],
+        "dosage": kb.get("dosage"),
+    }
+    for label, kb in DISEASE_KB.items()
 }
 
-ZS_LABELS = list(DISEASE_KB.keys()) + ["healthy leaf", "healthy fruit"]
-
-def ensure_zero_shot_loaded():
-    global _zs_pipeline
-    if _zs_pipeline is not None:
-        return
-    from transformers import pipeline
-    _zs_pipeline = pipeline("zero-shot-image-classification", model="openai/clip-vit-base-patch32")
-
-def local_zero_shot_diagnose(image) -> Dict[str, Any]:
-    ensure_zero_shot_loaded()
-    results = _zs_pipeline(image, candidate_labels=ZS_LABELS, hypothesis_template="a photo of {}")
-    best = results[0]
-    label = best.get("label", "unknown").lower()
-    score = float(best.get("score", 0.0))
-    if label in DISEASE_KB:
-        kb = DISEASE_KB[label]
-        treatment = kb["treatment"]
-        if kb.get("dosage"):
-            treatment = f"{treatment}\n\nRecommended dosage: {kb['dosage']}"
-        return {
-            "disease_name": label.title(),
-            "confidence": score,
-            "description": f"Why it occurs: {kb['why']}\n\nHow to avoid: {kb['avoid']}",
-            "treatment": treatment,
-        }
+@st.cache_resource(show_spinner=False)
+def get_zs_classifier():
+    # Cached per process: shared by all sessions and kept across reruns
+    import torch
+    from transformers import CLIPModel, CLIPProcessor
+    # fp16 on CUDA, bf16 on CPUs that support it; CLIP is robust to either
+    if torch.cuda.is_available():
+        device, dtype = "cuda", torch.float16
+    elif torch.cpu.is_bf16_supported():
+        device, dtype = "cpu", torch.bfloat16
+    else:
+        device, dtype = "cpu", torch.float32
+    model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32").to(device=device, dtype=dtype).eval()
+    processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32")
+    # The compiled tower would never serve an image while ONNX Runtime handles the image encoder
+    if _env_flag("TORCH_COMPILE") and get_onnx_image_encoder() is None:
+        # Opt-in: compile the vision tower once and warm it up so the first upload doesn't pay for it.
+        # Uploads arrive in batches of any size, so the batch dim is dynamic; warming up at 1 and 2
+        # covers both the specialized single-image graph and the symbolic-batch graph
+        try:
+            model.vision_model = torch.compile(model.vision_model, mode="reduce-overhead", dynamic=True)
+            size = model.config.vision_config.image_size
+            with torch.inference_mode():
+                for batch_size in (1, 2):
+                    model.get_image_features(pixel_values=torch.zeros((batch_size, 3, size, size), device=device, dtype=dtype))
+        except Exception as e:
+            print(f"torch.compile failed, using eager CLIP: {e}")
+            model.vision_model = getattr(model.vision_model, "_orig_mod", model.vision_model)
+    # The label prompts never change, so their text features are encoded once here
+    prompts = [f"a photo of {label}" for label in ZS_LABELS]
+    text_inputs = processor(text=prompts, return_tensors="pt", padding=True).to(device)
+    # Inside inference_mode so the folded logit_scale (an nn.Parameter) doesn't make the result require grad
+    with torch.inference_mode():
+        text_features = model.get_text_features(**text_inputs).float()
+        text_features = text_features / text_features.norm(dim=-1, keepdim=True)
+        # Fold CLIP's logit scale into a (D, L) classifier matrix so scoring is a single GEMM
+        label_weights = (text_features * model.logit_scale.float().exp()).T.contiguous()
+    return model, processor, label_weights
+
+@st.cache_resource(show_spinner=False)
+def get_onnx_image_encoder():
+    # Int8 ONNX Runtime session for the image encoder when CLIP_ONNX_PATH is set; None keeps PyTorch
+    path = os.getenv("CLIP_ONNX_PATH", "")
+    if not path:
+        return None
+    try:
+        import onnxruntime as ort
+        # Always the int8 variant (<root>.int8.onnx), so it never collides with the backend's fp32 file
+        return ort.InferenceSession(ensure_clip_image_encoder_onnx(path, int8=True), providers=["CPUExecutionProvider"])
+    except Exception as e:
+        print(f"ONNX Runtime image encoder unavailable, using PyTorch: {e}")
+        return None
+
+def format_diagnosis(label: str, score: float) -> Dict[str, Any]:
+    if label in _KB_RESPONSES:
+        return {**_KB_RESPONSES[label], "confidence": score}
     if "healthy" in label:
         return {
             "disease_name": "Healthy",
             "confidence": score,
             "description": "No disease indicators detected.",
             "treatment": "No action needed.",
+            "dosage": None,
         }
     return {
         "disease_name": f"Possible condition: {label}",
         "confidence": score,
         "description": "Condition not in knowledge base.",
         "treatment": "Consult a local agronomist for precise management.",
+        "dosage": None,
     }
 
+def local_zero_shot_diagnose_batch(images) -> List[Dict[str, Any]]:
+    import numpy as np
+    import torch
+    model, processor, label_weights = get_zs_classifier()
+    # All images go through the vision encoder in a single forward pass
+    pixel_values = processor(images=images, return_tensors="pt")["pixel_values"]
+    onnx_session = get_onnx_image_encoder()
+    if onnx_session is not None:
+        image_features = torch.from_numpy(onnx_session.run(None, {"pixel_values": pixel_values.numpy()})[0]).to(model.device)
+    else:
+        with torch.inference_mode():
+            image_features = model.get_image_features(pixel_values=pixel_values.to(device=model.device, dtype=model.dtype))
+    # Back to fp32 for the similarity and softmax
+    image_features = image_features.float()
+    image_features = image_features / image_features.norm(dim=-1, keepdim=True)
+    # One device-to-host copy, then a vectorized NumPy argmax per row
+    probs = (image_features @ label_weights).softmax(dim=-1).cpu().numpy()
+    best = probs.argmax(axis=-1)
+    scores = probs[np.arange(len(best)), best]
+    results = [
+        format_diagnosis(ZS_LABELS[idx], score)
+        for idx, score in zip(best.tolist(), scores.tolist())
+    ]
+    return results
+
+def local_zero_shot_diagnose(image) -> Dict[str, Any]:
+    return local_zero_shot_diagnose_batch([image])[0]
+
+@st.cache_resource(show_spinner=False)
+def get_http_session() -> requests.Session:
+    # Pooled keep-alive connections to the backend, shared across reruns
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=1)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+# Shorter-side bound for uploads: the largest input any model sees (BLIP's 384px in the backend,
+# matching its DECODE_MIN_SIDE); CLIP crops to 224 from this
+MIN_IMAGE_SIDE = 384
+
+def load_downscaled(uploaded_file) -> Image.Image:
+    uploaded_file.seek(0)
+    with Image.open(uploaded_file) as image:
+        # For JPEGs, libjpeg scales down in the DCT domain during decode; a no-op for other formats
+        image.draft("RGB", (MIN_IMAGE_SIDE, MIN_IMAGE_SIDE))
+        image.load()
+    # Bound the shorter side, like the backend, so wide photos still reach CLIP's crop size
+    scale = MIN_IMAGE_SIDE / min(image.size)
+    if scale < 1:
+        image = image.resize((round(image.width * scale), round(image.height * scale)), Image.Resampling.BILINEAR)
+    return image
+
+def backend_upload(uploaded_file):
+    # Small JPEGs go out as-is via a zero-copy view; anything else is downscaled and re-encoded
+    uploaded_file.seek(0)
+    with Image.open(uploaded_file) as header:
+        send_as_is = header.format == "JPEG" and min(header.size) <= MIN_IMAGE_SIDE
+    if send_as_is:
+        return (uploaded_file.name, uploaded_file.getbuffer(), uploaded_file.type)
+    image = load_downscaled(uploaded_file)
+    buf = io.BytesIO()
+    image.convert("RGB").save(buf, format="JPEG", quality=85)
+    buf.seek(0)
+    return ('img.jpg', buf, 'image/jpeg')
+
+def split_dosage(result: Dict[str, Any]) -> Dict[str, Any]:
+    # Backends that append the dosage to the treatment text are normalized once, before caching
+    if "dosage" in result:
+        return result
+    treatment = result.get("treatment", "")
+    dosage = None
+    if isinstance(treatment, str) and "Recommended dosage:" in treatment:
+        treatment, dosage = (part.strip() for part in treatment.split("Recommended dosage:", 1))
+    return {**result, "treatment": treatment, "dosage": dosage}
+
+@st.cache_data(show_spinner=False, max_entries=128)
+def cached_diagnose_batch(keys: tuple, _uploaded_files: list, run_local: bool, backend_url: str) -> List[Dict[str, Any]]:
+    # Memoized on the content hashes `keys`; underscore-prefixed args are not hashed by Streamlit
+    if run_local:
+        import torch
+        results = local_zero_shot_diagnose_batch([load_downscaled(f) for f in _uploaded_files])
+        # The batch's activations are released on return; hand the cached CUDA blocks back as well
+        if torch.cuda.is_available():
+            gc.collect()
+            torch.cuda.empty_cache()
+        return results
+    results = []
+    for uploaded_file in _uploaded_files:
+        # Prepare file for API request
+        files = {'file': backend_upload(uploaded_file)}
+        response = get_http_session().post(backend_url, files=files, timeout=60)
+        response.raise_for_status()
+        results.append(split_dosage(response.json()))
+    return results
+
 # --- PAGE CONFIGURATION ---
 st.set_page_config(
     page_title="PlantAI | AI-Powered Plant Disease Diagnosis",
@@ -127,8 +204,7 @@ st.set_page_config(
 )
 
 # --- CUSTOM CSS FOR MODERN UI ---
-def local_css():
-    st.markdown("""
+_CSS = """
         <style>
             /* --- Design Tokens --- */
             :root { --green-900:#0d5c21; --green-700:#246b33; --green-600:#2e8540; --green-100:#e8f5e9; --bg-soft:#f4f6f8; --text-700:#1f2a37; --text-500:#6b7280; --white:#ffffff; --warning:#f59e0b; --shadow:0 10px 30px rgba(4,120,87,.08); }
@@ -178,9 +254,21 @@ def local_css():
             .brand-green { color: var(--green-600); }
 
         </style>
-    """, unsafe_allow_html=True)
+    """
+
+# Static card markup, built once at import time rather than on every rerun
+_FEATURE_CARDS = (
+    '<div class="feature-card"><span class="icon">📸</span><h3>Instant Photo Diagnosis</h3><p>Just snap a picture. Our AI identifies the disease within seconds, no expertise required.</p></div>',
+    '<div class="feature-card"><span class="icon">💡</span><h3>AI-Powered Analysis</h3><p>Leveraging state-of-the-art vision models for highly accurate and reliable results.</p></div>',
+    '<div class="feature-card"><span class="icon">🌿</span><h3>Actionable Treatments</h3><p>Get clear, step-by-step treatment plans, including per-acre chemical compositions.</p></div>',
+)
+_HOW_IT_WORKS_CARDS = (
+    '<div class="how-it-works-card"><div class="step-number">01</div><h3>Upload Photo</h3><p>Select a clear image of the plant leaf showing symptoms of the disease.</p></div>',
+    '<div class="how-it-works-card"><div class="step-number">02</div><h3>AI Analyzes</h3><p>Our model processes the image, comparing it against millions of data points to find a match.</p></div>',
+    '<div class="how-it-works-card"><div class="step-number">03</div><h3>Get Your Report</h3><p>Receive an instant, detailed report with the diagnosis and a complete treatment guide.</p></div>',
+)
 
-local_css()
+st.markdown(_CSS, unsafe_allow_html=True)
 
 # --- HEADER / HERO SECTION ---
 with st.container():
@@ -189,6 +277,24 @@ with st.container():
     st.markdown('</div>', unsafe_allow_html=True)
 
 
+def render_diagnosis(result: Dict[str, Any]):
+    st.markdown('<div class="result-card">', unsafe_allow_html=True)
+    st.markdown("<span class='badge'>Diagnosis</span>", unsafe_allow_html=True)
+    st.subheader(f"{result['disease_name']}")
+    st.metric(label="Confidence", value=f"{result['confidence']:.2%}")
+    st.markdown('</div>', unsafe_allow_html=True)
+
+    with st.expander("📝 Detailed Description", expanded=True):
+        st.write(result.get('description', ''))
+    
+    with st.expander("👨‍⚕️ Recommended Treatment", expanded=True):
+        st.write(result.get('treatment', ''))
+        if result.get('dosage'):
+            st.markdown('<div class="dosage">', unsafe_allow_html=True)
+            st.write(f"Recommended dosage: {result['dosage']}")
+            st.markdown('</div>', unsafe_allow_html=True)
+
+
 # --- DIAGNOSIS SECTION ---
 with st.container():
     st.markdown('<div class="diagnosis-section" id="diagnosis-anchor">', unsafe_allow_html=True)
@@ -202,62 +308,46 @@ with st.container():
         help="The endpoint URL for the PlantAI backend service. Set BACKEND_URL_DEFAULT env var when deploying."
     )
 
-    uploaded_file = st.file_uploader(
-        "Upload a photo of the affected plant leaf.",
-        type=["jpg", "jpeg", "png"]
+    uploaded_files = st.file_uploader(
+        "Upload photos of the affected plant leaves.",
+        type=["jpg", "jpeg", "png"],
+        accept_multiple_files=True,
     )
 
-    if uploaded_file is not None:
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            image = Image.open(uploaded_file)
-            st.image(image, caption="Uploaded Image", use_container_width=True)
-
-        with col2:
-            if not run_local and not backend_url_input:
-                st.warning("Please enter the backend URL to proceed with the diagnosis.")
+    if uploaded_files:
+        results = None
+        if not run_local and not backend_url_input:
+            st.warning("Please enter the backend URL to proceed with the diagnosis.")
+        else:
+            # Widget reruns with the same uploads and mode reuse this session's last results outright
+            file_ids = tuple(getattr(f, "file_id", None) or hashlib.sha1(f.getbuffer()).hexdigest() for f in uploaded_files)
+            diagnosis_key = (file_ids, run_local, backend_url_input)
+            if st.session_state.get("last_diagnosis_key") == diagnosis_key:
+                results = st.session_state["last_results"]
             else:
-                with st.spinner("Our AI is analyzing the image..."):
+                with st.spinner("Our AI is analyzing the images..."):
                     try:
-                        if run_local:
-                            result = local_zero_shot_diagnose(image)
-                        else:
-                            # Prepare file for API request
-                            file_bytes = io.BytesIO(uploaded_file.getvalue())
-                            files = {'file': (uploaded_file.name, file_bytes, uploaded_file.type)}
-                            response = requests.post(backend_url_input, files=files, timeout=60)
-                            response.raise_for_status()
-                            result = response.json()
-
-                        # Extract dosage if appended in treatment
-                        dosage_text = None
-                        treatment_text = result.get('treatment', '')
-                        if isinstance(treatment_text, str) and 'Recommended dosage:' in treatment_text:
-                            parts = treatment_text.split('Recommended dosage:')
-                            treatment_text = parts[0].strip()
-                            dosage_text = parts[1].strip()
-
-                        st.markdown('<div class="result-card">', unsafe_allow_html=True)
-                        st.markdown("<span class='badge'>Diagnosis</span>", unsafe_allow_html=True)
-                        st.subheader(f"{result['disease_name']}")
-                        st.metric(label="Confidence", value=f"{result['confidence']:.2%}")
-                        st.markdown('</div>', unsafe_allow_html=True)
-
-                        with st.expander("📝 Detailed Description", expanded=True):
-                            st.write(result.get('description', ''))
-                        
-                        with st.expander("👨‍⚕️ Recommended Treatment", expanded=True):
-                            st.write(treatment_text)
-                            if dosage_text:
-                                st.markdown('<div class="dosage">', unsafe_allow_html=True)
-                                st.write(f"Recommended dosage: {dosage_text}")
-                                st.markdown('</div>', unsafe_allow_html=True)
-
+                        # Re-uploads of the same files are served from the cache
+                        image_keys = tuple(hashlib.sha1(f.getbuffer()).hexdigest() for f in uploaded_files)
+                        results = cached_diagnose_batch(image_keys, uploaded_files, run_local, backend_url_input)
+                        st.session_state["last_diagnosis_key"] = diagnosis_key
+                        st.session_state["last_results"] = results
                     except requests.exceptions.RequestException as e:
                         st.error(f"Failed to connect to the diagnosis service. Please ensure the backend is running and the URL is correct. Error: {e}")
                     except Exception as e:
                         st.error(f"An error occurred during diagnosis: {e}")
+
+        for i, uploaded_file in enumerate(uploaded_files):
+            col1, col2 = st.columns(2)
+
+            with col1:
+                uploaded_file.seek(0)
+                with Image.open(uploaded_file) as image:
+                    st.image(image, caption=uploaded_file.name, use_container_width=True)
+
+            with col2:
+                if results is not None:
+                    render_diagnosis(results[i])
     
     st.markdown('</div>', unsafe_allow_html=True)
     st.markdown("<br><br>", unsafe_allow_html=True)
@@ -268,12 +358,8 @@ with st.container():
     st.markdown('<div class="section-header"><h2>Why Choose PlantAI?</h2><p>We provide cutting-edge tools to protect your crops and garden.</p></div>', unsafe_allow_html=True)
     
     cols = st.columns(3, gap="large")
-    with cols[0]:
-        st.markdown('<div class="feature-card"><span class="icon">📸</span><h3>Instant Photo Diagnosis</h3><p>Just snap a picture. Our AI identifies the disease within seconds, no expertise required.</p></div>', unsafe_allow_html=True)
-    with cols[1]:
-        st.markdown('<div class="feature-card"><span class="icon">💡</span><h3>AI-Powered Analysis</h3><p>Leveraging state-of-the-art vision models for highly accurate and reliable results.</p></div>', unsafe_allow_html=True)
-    with cols[2]:
-        st.markdown('<div class="feature-card"><span class="icon">🌿</span><h3>Actionable Treatments</h3><p>Get clear, step-by-step treatment plans, including per-acre chemical compositions.</p></div>', unsafe_allow_html=True)
+    for col, card in zip(cols, _FEATURE_CARDS):
+        col.markdown(card, unsafe_allow_html=True)
     st.markdown("<br><br><br>", unsafe_allow_html=True)
 
 
@@ -282,12 +368,8 @@ with st.container():
     st.markdown('<div class="section-header"><h2>How It Works</h2><p>A simple, three-step process to a healthy harvest.</p></div>', unsafe_allow_html=True)
     
     cols = st.columns(3, gap="large")
-    with cols[0]:
-        st.markdown('<div class="how-it-works-card"><div class="step-number">01</div><h3>Upload Photo</h3><p>Select a clear image of the plant leaf showing symptoms of the disease.</p></div>', unsafe_allow_html=True)
-    with cols[1]:
-        st.markdown('<div class="how-it-works-card"><div class="step-number">02</div><h3>AI Analyzes</h3><p>Our model processes the image, comparing it against millions of data points to find a match.</p></div>', unsafe_allow_html=True)
-    with cols[2]:
-        st.markdown('<div class="how-it-works-card"><div class="step-number">03</div><h3>Get Your Report</h3><p>Receive an instant, detailed report with the diagnosis and a complete treatment guide.</p></div>', unsafe_allow_html=True)
+    for col, card in zip(cols, _HOW_IT_WORKS_CARDS):
+        col.markdown(card, unsafe_allow_html=True)
     st.markdown("<br><br><br>", unsafe_allow_html=True)
 
 
@@ -0,0 +1,78 @@
+import sys
+from types import MappingProxyType
+
+# Simple knowledge base for common plant diseases (leaf/fruit)
+_DISEASE_KB_RAW = {
+    "powdery mildew": {
+        "why": "Caused by fungal pathogens thriving in dry, warm days and cool, humid nights; poor air circulation.",
+        "avoid": "Improve airflow, avoid overhead irrigation, prune crowded foliage, rotate crops, and use resistant varieties.",
+        "treatment": "Apply sulfur or potassium bicarbonate fungicides; remove infected leaves; maintain spacing and sanitation.",
+        "dosage": "Wettable sulfur 2–3 g/L water for foliar spray; potassium bicarbonate 5–10 g/L. Field: 1–1.5 kg/acre depending on canopy.",
+    },
+    "downy mildew": {
+        "why": "Oomycete infection favored by cool, wet conditions and prolonged leaf wetness.",
+        "avoid": "Water early so leaves dry quickly, increase spacing, rotate crops, use resistant varieties.",
+        "treatment": "Copper-based fungicides at first sign; remove infected tissue; improve drainage and airflow.",
+        "dosage": "Copper oxychloride 2–3 g/L water (200–300 g/100 L). Field: 1–2 kg/acre per spray, 7–10 day interval.",
+    },
+    "early blight": {
+        "why": "Alternaria fungus; splashes from soil, high humidity, and plant stress.",
+        "avoid": "Mulch to prevent soil splash, rotate crops 2–3 years, avoid overhead watering, fertilize adequately.",
+        "treatment": "Copper or chlorothalonil fungicides; remove infected leaves; stake plants to improve airflow.",
+        "dosage": "Chlorothalonil 2 g/L water; Mancozeb 2–2.5 g/L. Field: 1–1.5 kg/acre per application.",
+    },
+    "late blight": {
+        "why": "Phytophthora infestans; cool, humid weather; spreads rapidly via spores.",
+        "avoid": "Plant certified seed/seedlings, avoid overhead irrigation, destroy volunteers, rotate crops.",
+        "treatment": "Immediate removal and destruction of infected plants; protectant fungicides containing mancozeb/cymoxanil where permitted.",
+        "dosage": "Mancozeb 2–2.5 g/L; Cymoxanil + Mancozeb per label (commonly 1.5–2 g/L). Field: 1.5–2 kg/acre.",
+    },
+    "leaf spot": {
+        "why": "Various fungi/bacteria; splash dispersal and high humidity.",
+        "avoid": "Water at soil level, sanitize tools, remove debris, ensure spacing.",
+        "treatment": "Copper sprays for bacterial spots; broad-spectrum fungicide for fungal spots; remove infected leaves.",
+        "dosage": "Copper hydroxide 2 g/L; Captan 2 g/L for fungal spots. Field: ~1 kg/acre per spray.",
+    },
+    "rust": {
+        "why": "Fungal rusts; spread by wind-borne spores in humid conditions.",
+        "avoid": "Resistant cultivars, remove alternate hosts, avoid wet foliage.",
+        "treatment": "Apply triazole or strobilurin fungicides per label; remove infected parts.",
+        "dosage": "Propiconazole 1 ml/L water; Azoxystrobin 0.5 ml/L. Field: 200–300 ml/acre depending on formulation.",
+    },
+    "anthracnose": {
+        "why": "Colletotrichum fungi causing fruit/leaf lesions; warm, wet weather.",
+        "avoid": "Rotate crops, sanitize debris, improve airflow, avoid overhead watering.",
+        "treatment": "Protectant fungicides; prune infected tissue; postharvest sanitation for fruits.",
+        "dosage": "Carbendazim 1 g/L or Azoxystrobin 0.5 ml/L. Field: 200–300 ml or 0.5–1 kg/acre per label.",
+    },
+    "canker": {
+        "why": "Fungal/bacterial pathogens entering wounds; stress and poor pruning practices.",
+        "avoid": "Prune during dry weather, disinfect tools, avoid injuries, maintain vigor.",
+        "treatment": "Prune 10–15 cm below lesions; dispose debris; copper sprays for bacterial cankers.",
+        "dosage": "Copper oxychloride paste on wounds; spray 2–3 g/L after pruning. Field sprays as per label (~1–2 kg/acre).",
+    },
+    "mosaic virus": {
+        "why": "Viral infection often vectored by aphids/whiteflies; transmitted by tools.",
+        "avoid": "Control vectors, use virus-free seed, sanitize tools, remove weeds hosts.",
+        "treatment": "No cure; rogue infected plants; manage vectors; plant resistant varieties.",
+        "dosage": "For vectors: Neem oil 3–5 ml/L or Imidacloprid 0.3 ml/L as per local regulations.",
+    },
+    "nutrient deficiency": {
+        "why": "Insufficient or imbalanced nutrients (N, P, K, Fe, Mg) and pH issues.",
+        "avoid": "Soil test annually; maintain optimal pH; balanced fertilization; organic matter.",
+        "treatment": "Apply specific nutrient amendments per soil test; foliar feeds for rapid correction.",
+        "dosage": "General foliar feed: 1–2 g/L balanced NPK; Fe-EDDHA 0.5–1 g/L for iron chlorosis. Field: follow soil test recommendations.",
+    },
+    "sunscald": {
+        "why": "High light/heat exposure damaging fruit/leaf tissues.",
+        "avoid": "Provide shade cloth in heat waves; maintain foliage cover; avoid heavy pruning before hot days.",
+        "treatment": "Remove damaged tissue if rotting; improve shading and irrigation scheduling.",
+        "dosage": "Apply kaolin clay film 30–50 g/L as protective spray; irrigation 20–30 mm depending on soil moisture.",
+    },
+}
+
+# Read-only view with interned keys; the KB is static and shared by every request
+DISEASE_KB = MappingProxyType({sys.intern(k): MappingProxyType(v) for k, v in _DISEASE_KB_RAW.items()})
+
+# Candidate labels for zero-shot image classification
+ZS_LABELS = tuple(DISEASE_KB) + (sys.intern("healthy leaf"), sys.intern("healthy fruit"))